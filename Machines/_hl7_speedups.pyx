@@ -0,0 +1,28 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""C fast paths for hl7_common; the module falls back to pure Python without them."""
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize
+from libc.string cimport memcpy
+
+cdef extern from "Python.h":
+    const char* PyUnicode_AsUTF8AndSize(object unicode, Py_ssize_t* size) except NULL
+
+def join_encode(segments):
+    """UTF-8 encode and concatenate str segments into one bytes object, allocated once.
+
+    Like the pure-Python fallback, segments may be any iterable of str.
+    """
+    # Two passes over the segments, so materialize anything that isn't already a list.
+    cdef list seq = segments if type(segments) is list else list(segments)
+    cdef Py_ssize_t total = 0, size
+    cdef const char* src
+    cdef char* dst
+    for s in seq:
+        PyUnicode_AsUTF8AndSize(s, &size)
+        total += size
+    out = PyBytes_FromStringAndSize(NULL, total)
+    dst = PyBytes_AS_STRING(out)
+    for s in seq:
+        src = PyUnicode_AsUTF8AndSize(s, &size)
+        memcpy(dst, src, size)
+        dst += size
+    return out
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
-import argparse, random, sys, time
-from hl7_common import HL7Builder, MLLPClient, ts
+import argparse, asyncio, random
+from hl7_common import HL7Builder, MessageBatch, add_mllp_args, stdout, run_simulator, ts, obx_nm
 
 class CapnoModel:
     def __init__(self, seed=None):
@@ -15,9 +15,9 @@ class CapnoModel:
         self.rr = rw(self.rr, 8, 35, 0.8)
         self.etco2 = rw(self.etco2, 10, 60, 1.0)
 
-def main():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Capnograph Simulator")
-    p.add_argument("--mllp-host"); p.add_argument("--mllp-port", type=int)
+    add_mllp_args(p)
     p.add_argument("--stdout", action="store_true")
     p.add_argument("--interval", type=float, default=3.0)
     p.add_argument("--count", type=int, default=0)
@@ -25,32 +25,40 @@ def main():
     p.add_argument("--patient-name", default="DOE^JOHN")
     p.add_argument("--device-id", default="CAPNO^ICU-01")
     p.add_argument("--seed", type=int, default=None)
-    args = p.parse_args()
+    args = p.parse_args(argv)
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         p.error("Choose an output: --stdout or --mllp-host/--mllp-port")
+    return args
 
+async def run(client, args):
     b = HL7Builder(sending_app="CAPNOGRAPH_SIM")
-    client = MLLPClient(args.mllp_host, args.mllp_port) if args.mllp_host and args.mllp_port else None
     model = CapnoModel(args.seed)
 
     sent=0
+    batch = MessageBatch(client, args.batch, args.max_hold) if client else None
     try:
         while True:
             model.step()
             now = ts()
             obxs = []
-            obxs.append(b.obx_numeric(1, "18184-2", "Carbon dioxide [Partial pressure] in Exhaled gas at end expiration", "LN", round(model.etco2,1), "mm[Hg]", observation_time=now))
-            obxs.append(b.obx_numeric(2, "9279-1", "Respiratory rate", "LN", round(model.rr), "/min", observation_time=now))
+            obxs.append(obx_nm(1, "18184-2", "Carbon dioxide [Partial pressure] in Exhaled gas at end expiration", "LN", f"{model.etco2:.1f}", "mm[Hg]", now))
+            obxs.append(obx_nm(2, "9279-1", "Respiratory rate", "LN", f"{model.rr:.0f}", "/min", now))
 
             msg = b.build_message(args.patient_id, args.patient_name, args.device_id, obxs, now)
-            if args.stdout: sys.stdout.write(msg + "\n"); sys.stdout.flush()
-            if client: client.send(msg)
+            if args.stdout: stdout.write(msg)
+            if client: batch.append(msg)
+            wait = max(0.05, args.interval)
+            if client: await batch.send_due(wait)
+            if args.stdout: stdout.maybe_flush(wait)
             sent+=1
             if args.count and sent>=args.count: break
-            time.sleep(max(0.05, args.interval))
-    except KeyboardInterrupt:
-        pass
+            await asyncio.sleep(wait)
+    finally:
+        if client: await batch.close()
+
+def main():
+    run_simulator(run, parse_args())
 
 if __name__ == "__main__":
     main()
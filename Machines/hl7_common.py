@@ -1,17 +1,37 @@
 #!/usr/bin/env python3
-import socket, time
-from datetime import datetime, timezone
+import asyncio, itertools, os, socket, sys, time
+from collections import deque
+from datetime import datetime
 
 FIELD_SEP = "|"
 COMP_SEP = "^"
 SB = b"\x0b"
 EB = b"\x1c"
 CR = b"\x0d"
+EB_CR = EB + CR
+_IOV_MAX = 1024
+SOCK_BUF_SIZE = 1 << 20
+
+try:
+    # Optional C fast path: python setup.py build_ext --inplace
+    from _hl7_speedups import join_encode
+except ImportError:
+    def join_encode(segments: list[str]) -> bytes:
+        return "".join(segments).encode("utf-8")
+
+_ts_second = -1
+_ts_text = ""
 
 def ts(dt: datetime | None = None) -> str:
-    if dt is None:
-        dt = datetime.now(timezone.utc)
-    return dt.strftime("%Y%m%d%H%M%S")
+    global _ts_second, _ts_text
+    if dt is not None:
+        return dt.strftime("%Y%m%d%H%M%S")
+    # Second resolution: format once per wall-clock second, reuse it within the second.
+    now = int(time.time())
+    if now != _ts_second:
+        t = time.gmtime(now)
+        _ts_second, _ts_text = now, f"{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
+    return _ts_text
 
 def comp(*parts) -> str:
     return COMP_SEP.join("" if p is None else str(p) for p in parts)
@@ -19,6 +39,16 @@ def comp(*parts) -> str:
 def seg(name: str, *fields) -> str:
     return name + FIELD_SEP + FIELD_SEP.join("" if f is None else str(f) for f in fields) + "\r"
 
+# Numeric OBX always has the same shape, so skip seg()/comp() on the per-tick path.
+_OBX_NM_TPL = "OBX|{i}|NM|{c}^{t}^{s}|{sub}|{v}|{u}^{ut}^{us}|||||F||{ot}\r"
+
+def obx_nm(i, c, t, s, v, u, ot, sub="", ut="", us="UCUM") -> str:
+    return _OBX_NM_TPL.format(i=i, c=c, t=t, s=s, sub=sub, v=v, u=u, ut=ut, us=us, ot=ot)
+
+# OBR-2 placer numbers: one counter for every builder in the process, so devices never collide.
+_PROC_ID = os.getpid()
+_placer_seq = itertools.count(1)
+
 class HL7Builder:
     def __init__(self, sending_app="ICU_SIM", sending_fac="ICU", receiving_app="LIS", receiving_fac="HOSP",
                  version="2.5"):
@@ -28,97 +58,92 @@ class HL7Builder:
         self.receiving_fac = receiving_fac
         self.version = version
         self.ctrl_id = 1
+        # MSH/PID/OBR only vary by time, control ID, patient and device: format the rest once.
+        head = FIELD_SEP.join((sending_app, sending_fac, receiving_app, receiving_fac))
+        head = head.replace("{", "{{").replace("}", "}}")
+        ver = version.replace("{", "{{").replace("}", "}}")
+        self._prefix_tpl = (
+            "MSH|^~\\&|" + head + "|{ts}||ORU^R01^ORU_R01|{cid}|P|" + ver + "\r"
+            "PID|1||{pid}^^^HOSP^MR||{name}||||||||||U\r"
+            "OBR|1|{placer}^ICU_SIM|{dev}^DEVICE|VITALS^Vital Signs Panel^L^76499-3^Vital signs^LN||||||||||{ts}||||||F\r"
+        )
 
     def next_ctrl_id(self):
         cid = f"MSG{int(time.time())}-{self.ctrl_id}"
         self.ctrl_id += 1
         return cid
 
-    def msh(self, message_time: str):
-        return seg("MSH",
-                   "^~\\&",
-                   self.sending_app,
-                   self.sending_fac,
-                   self.receiving_app,
-                   self.receiving_fac,
-                   message_time,
-                   "",
-                   "ORU^R01^ORU_R01",
-                   self.next_ctrl_id(),
-                   "P",
-                   self.version)
-
-    def pid(self, patient_id="123456", patient_name="DOE^JOHN", sex="U"):
-        return seg("PID",
-                   "1",
-                   "",
-                   comp(patient_id, "", "", "HOSP^MR"),
-                   "",
-                   patient_name,
-                   "", "", "", "", "", "", "", "", "",
-                   sex)
-
-    def obr(self, message_time: str, device_id: str, panel_code=("VITALS","Vital Signs Panel","L","76499-3","Vital signs","LN")):
-        from uuid import uuid4
-        return seg("OBR",
-                   "1",
-                   comp(str(uuid4()), "ICU_SIM"),
-                   comp(device_id, "DEVICE"),
-                   comp(*panel_code),
-                   "", "", "", "", "", "", "", "", "",
-                   message_time,
-                   "", "", "", "", "",
-                   "F")
+    def next_placer_id(self):
+        # OBR-2 only has to be unique per sender, so a per-process counter beats uuid4().
+        return f"{_PROC_ID}{next(_placer_seq):08d}"
 
+    # `now` is required so a tick computes ts() once and threads it through every segment.
     def obx_numeric(self, set_id: int, loinc_code: str, text: str, coding_system: str, value, units_code: str, units_text: str = "", units_sys: str = "UCUM",
-                    observation_time: str | None = None, sub_id: str = ""):
-        obs_id = comp(loinc_code, text, coding_system)
-        units  = comp(units_code, units_text, units_sys)
-        return seg("OBX",
-                   str(set_id),
-                   "NM",
-                   obs_id,
-                   sub_id,
-                   str(value),
-                   units,
-                   "",
-                   "",
-                   "",
-                   "",
-                   "F",
-                   "",
-                   (observation_time or ts()))
-
-    def build_message(self, patient_id, patient_name, device_id, obx_segments, message_time=None):
-        message_time = message_time or ts()
-        return self.msh(message_time) + self.pid(patient_id, patient_name) + self.obr(message_time, device_id) + "".join(obx_segments)
+                    *, now: str, sub_id: str = ""):
+        return obx_nm(set_id, loinc_code, text, coding_system, value, units_code, now, sub_id, units_text, units_sys)
+
+    def build_message(self, patient_id, patient_name, device_id, obx_segments, now: str):
+        prefix = self._prefix_tpl.format_map({"ts": now, "cid": self.next_ctrl_id(), "pid": patient_id,
+                                              "name": patient_name, "placer": self.next_placer_id(), "dev": device_id})
+        return join_encode([prefix, *obx_segments])
+
+def tune_socket(s, keepalive: bool) -> None:
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
+    if keepalive:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+def sendmsg_all(sock: socket.socket, buffers) -> None:
+    """Gather-write buffers in order with sendmsg(), resuming after partial writes."""
+    if not hasattr(sock, "sendmsg"):  # Windows
+        sock.sendall(b"".join(buffers))
+        return
+    views = [memoryview(b) for b in buffers if b]
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i + _IOV_MAX])
+        while sent:
+            size = len(views[i])
+            if sent < size:
+                views[i] = views[i][sent:]
+                break
+            sent -= size
+            i += 1
 
 class MLLPClient:
-    def __init__(self, host: str, port: int, timeout: float = 10.0, keepalive: bool = True):
+    """Blocking MLLP sender; skip_ack=True returns right after the write."""
+    def __init__(self, host: str, port: int, timeout: float = 10.0, keepalive: bool = True, skip_ack: bool = False):
         self.host = host
         self.port = port
         self.timeout = timeout
         self.keepalive = keepalive
+        self.skip_ack = skip_ack
         self.sock = None
 
     def connect(self):
         if self.sock is None:
             s = socket.create_connection((self.host, self.port), timeout=self.timeout)
             s.settimeout(self.timeout)
+            tune_socket(s, self.keepalive)
             self.sock = s
 
     def close(self):
         if self.sock:
-            try: self.sock.close()
-            finally: self.sock = None
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
 
-    def send(self, hl7_message: str) -> str | None:
-        data = SB + hl7_message.encode("utf-8") + EB + CR
+    def send(self, hl7_message: bytes) -> str | None:
         try:
             self.connect()
-            self.sock.sendall(data)
+            sock = self.sock
+            sendmsg_all(sock, (SB, hl7_message, EB_CR))
+            if self.skip_ack:
+                return None
             try:
-                ack = self.sock.recv(4096)
+                ack = sock.recv(4096)
                 if ack:
                     return ack.decode("utf-8", errors="ignore")
             except socket.timeout:
@@ -127,3 +152,190 @@ class MLLPClient:
             if not self.keepalive:
                 self.close()
         return None
+
+class AsyncMLLPClient:
+    """asyncio MLLP sender, shareable between tasks; a reader task hands ACKs to messages in send order."""
+    def __init__(self, host: str, port: int, timeout: float = 10.0, keepalive: bool = True, skip_ack: bool = False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.skip_ack = skip_ack
+        self.reader = None
+        self.writer = None
+        self._lock = asyncio.Lock()
+        self._pending = deque()   # (deadline, future) per message awaiting its ACK
+        self._ack_task = None
+
+    async def connect(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            tune_socket(self.writer.get_extra_info("socket"), self.keepalive)
+            # Each connection gets its own queue, so a stale reader can't take a new connection's ACKs.
+            self._pending = deque()
+            self._ack_task = asyncio.create_task(self._read_acks(self.reader, self._pending))
+
+    async def flush_acks(self):
+        # ACKs arrive in send order, so once the newest message is answered all of them are.
+        if self._pending:
+            await asyncio.wait([self._pending[-1][1]], timeout=self.timeout)
+
+    async def close(self):
+        if self.writer:
+            try:
+                # Closing with ACKs unread makes our kernel reset the connection, and the
+                # receiver then drops messages it hasn't read yet.
+                await self.flush_acks()
+                self._ack_task.cancel()
+                self.writer.close()
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            finally:
+                self.reader = self.writer = self._ack_task = None
+
+    async def _read_acks(self, reader, pending):
+        try:
+            while True:
+                ack = await reader.readuntil(EB_CR)
+                if pending:
+                    _, waiter = pending.popleft()
+                    if not waiter.done():
+                        waiter.set_result(ack[ack.find(SB) + 1:-2].decode("utf-8", errors="ignore"))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            while pending:
+                _, waiter = pending.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def send(self, hl7_message: bytes) -> str | None:
+        acks = await self.send_batch([hl7_message])
+        return acks[0] if acks else None
+
+    async def send_batch(self, hl7_messages: list[bytes], wait_ack: bool = True) -> list[str]:
+        """Write all framed messages in one go; return their ACKs, or [] right away if not wait_ack."""
+        if not hl7_messages:
+            return []
+        views = []
+        for m in hl7_messages:
+            views += (SB, m, EB_CR)
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            if self._pending and self._pending[0][0] < loop.time():
+                await self.close()
+            await self.connect()
+            waiters = []
+            if not self.skip_ack:
+                deadline = loop.time() + self.timeout
+                waiters = [loop.create_future() for _ in hl7_messages]
+                self._pending.extend((deadline, w) for w in waiters)
+            self.writer.writelines(views)
+            await self.writer.drain()
+            if not wait_ack:
+                waiters = []
+            if not self.keepalive:
+                try:
+                    return await self._collect(waiters)
+                finally:
+                    await self.close()
+        return await self._collect(waiters)
+
+    async def _collect(self, waiters) -> list[str]:
+        if not waiters:
+            return []
+        await asyncio.wait(waiters, timeout=self.timeout)
+        acks = []
+        for w in waiters:
+            if not w.done() or w.result() is None:
+                break
+            acks.append(w.result())
+        return acks
+
+class MessageBatch:
+    """Messages coalesced into one MLLP write, held at most max_hold seconds."""
+    def __init__(self, client, size: int, max_hold: float):
+        self.client = client
+        self.size = size
+        self.max_hold = max_hold
+        self._msgs = []
+        self._since = 0.0
+
+    def append(self, hl7_message: bytes) -> None:
+        if not self._msgs:
+            self._since = time.monotonic()
+        self._msgs.append(hl7_message)
+
+    async def send_due(self, next_wait: float) -> None:
+        """Send if the batch is full, or if sleeping next_wait more would exceed max_hold."""
+        if self._msgs and (len(self._msgs) >= self.size
+                           or time.monotonic() + next_wait - self._since > self.max_hold):
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._msgs:
+            msgs, self._msgs = self._msgs, []
+            await self.client.send_batch(msgs, wait_ack=False)
+
+    async def close(self) -> None:
+        """Send what's left and wait for every ACK still outstanding (end of run)."""
+        await self.flush()
+        await self.client.flush_acks()
+
+class BufferedStdout:
+    """Binary stdout (looked up per write), flushed at most every flush_interval seconds."""
+    def __init__(self, flush_interval: float = 0.1):
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def write(self, hl7_message: bytes) -> None:
+        out = getattr(sys.stdout, "buffer", None)
+        if out is None:
+            sys.stdout.write(hl7_message.decode("utf-8") + "\n")
+        else:
+            out.write(hl7_message)
+            out.write(b"\n")
+
+    def maybe_flush(self, next_wait: float = 0.0) -> None:
+        """Flush if the interval is up, or will be before the caller's next_wait sleep ends."""
+        if time.monotonic() + next_wait - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        sys.stdout.flush()
+        self._last_flush = time.monotonic()
+
+# Shared by every simulator in the process, so the orchestrator's tasks batch their output together.
+stdout = BufferedStdout()
+
+def add_mllp_args(p) -> None:
+    p.add_argument("--mllp-host"); p.add_argument("--mllp-port", type=int)
+    p.add_argument("--batch", type=int, default=1, help="Messages to coalesce per MLLP write")
+    p.add_argument("--max-hold", type=float, default=1.0,
+                   help="Longest a message waits for its batch to fill before it is sent anyway (seconds)")
+    p.add_argument("--skip-ack", action="store_true", help="Don't wait for ACKs (for receivers that never send them)")
+
+def bed_ids(patient_id: str, device_id: str, num_beds: int) -> list[tuple[str, str]]:
+    """(patient ID, device ID) per simulated bed; a single bed keeps the IDs as given."""
+    if num_beds == 1:
+        return [(patient_id, device_id)]
+    return [(f"{patient_id}-{n:02d}", f"{device_id}-{n:02d}") for n in range(1, num_beds + 1)]
+
+def run_simulator(run, args) -> None:
+    """Run one simulator's run(client, args) coroutine standalone, on its own connection."""
+    client = AsyncMLLPClient(args.mllp_host, args.mllp_port, skip_ack=args.skip_ack) if args.mllp_host and args.mllp_port else None
+
+    async def _main():
+        try:
+            await run(client, args)
+        finally:
+            if client:
+                await client.close()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stdout.flush()
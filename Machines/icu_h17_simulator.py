@@ -18,16 +18,19 @@ Usage examples:
 
 Notes:
 - Generates HL7 v2.5 ORU^R01 messages with OBX segments using common LOINC codes.
-- No external libraries required.
+- Requires NumPy for the vital-sign random walk (Numba optional, see random_walk.py).
 """
 
 import argparse
-import random
+import itertools
+import os
 import socket
 import sys
 import time
-from datetime import datetime, timezone
-import uuid
+from datetime import datetime
+
+import numpy as np
+import random_walk
 
 FIELD_SEP = "|"
 COMP_SEP = "^"
@@ -39,12 +42,24 @@ SUBCOMP_SEP = "&"
 SB = b"\x0b"       # <VT>  vertical tab, start block
 EB = b"\x1c"       # <FS>  file separator, end block
 CR = b"\x0d"       # <CR>  carriage return
+EB_CR = EB + CR
+
+SOCK_BUF_SIZE = 1 << 20   # SO_SNDBUF / SO_RCVBUF for MLLP connections
+
+_ts_second = -1
+_ts_text = ""
 
 def ts(dt: datetime | None = None) -> str:
-    """HL7 timestamp in YYYYMMDDHHMMSS (ZZZ optional)."""
-    if dt is None:
-        dt = datetime.now(timezone.utc)
-    return dt.strftime("%Y%m%d%H%M%S")
+    """HL7 timestamp in YYYYMMDDHHMMSS (ZZZ optional), UTC unless dt is given."""
+    global _ts_second, _ts_text
+    if dt is not None:
+        return dt.strftime("%Y%m%d%H%M%S")
+    # Second resolution: format once per wall-clock second, reuse it within the second.
+    now = int(time.time())
+    if now != _ts_second:
+        t = time.gmtime(now)
+        _ts_second, _ts_text = now, f"{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
+    return _ts_text
 
 def comp(*parts) -> str:
     return COMP_SEP.join("" if p is None else str(p) for p in parts)
@@ -52,45 +67,47 @@ def comp(*parts) -> str:
 def seg(name: str, *fields) -> str:
     return name + FIELD_SEP + FIELD_SEP.join("" if f is None else str(f) for f in fields) + "\r"
 
+# Numeric OBX: set ID, NM, identifier (CE), sub-ID, value, units, ref range, flags,
+# probability, nature, status F, effective date, observation time, then OBX-15..26 empty.
+_OBX_NM_TPL = "OBX|{i}|NM|{c}^{t}^{s}||{v}|{u}^^UCUM|||||F||{ot}||||||||||||\r"
+
 class VitalModel:
     """Random-walk model to generate plausible ICU vitals."""
+    # state columns: HR (bpm), RR (breaths/min), SpO2 (%), Temp (degC), Sys (mmHg), Dia (mmHg)
+    _LO   = np.array([45, 8, 80, 35.0, 80, 40])
+    _HI   = np.array([150, 28, 100, 40.0, 200, 120])
+    _STEP = np.array([2.0, 0.6, 0.4, 0.08, 2.5, 2.0])
+
     def __init__(self, seed=None):
-        rnd = random.Random(seed)
-        self.hr  = rnd.uniform(70, 95)      # bpm
-        self.rr  = rnd.uniform(12, 18)      # breaths/min
-        self.spo2= rnd.uniform(95, 99)      # %
-        self.temp= rnd.uniform(36.5, 37.3)  # degC
-        self.sys = rnd.uniform(110, 130)    # mmHg
-        self.dia = rnd.uniform(70, 85)      # mmHg
-
-    def step(self, rnd=None):
-        rnd = rnd or random
-        def rw(v, lo, hi, step=0.5):
-            v += rnd.uniform(-step, step)
-            return max(lo, min(hi, v))
-
-        self.hr   = rw(self.hr, 45, 150, 2.0)
-        self.rr   = rw(self.rr, 8, 28, 0.6)
-        self.spo2 = rw(self.spo2, 80, 100, 0.4)
-        self.temp = rw(self.temp, 35.0, 40.0, 0.08)
-        self.sys  = rw(self.sys, 80, 200, 2.5)
-        self.dia  = rw(self.dia, 40, 120, 2.0)
+        self._rng = np.random.default_rng(seed)
+        self.state = self._rng.uniform([70, 12, 95, 36.5, 110, 70], [95, 18, 99, 37.3, 130, 85])
+
+    def step(self):
+        """Advance every vital by one bounded random-walk step."""
+        random_walk.step(self.state, self._LO, self._HI, self._STEP, self._rng)
 
     @property
     def map(self):
-        return self.dia + (self.sys - self.dia) / 3.0
+        sbp, dbp = self.state[4:6]
+        return dbp + (sbp - dbp) / 3.0
 
     def snapshot(self) -> dict:
+        """Vitals as ready-to-send OBX-5 strings (whole numbers, SpO2/Temp to 0.1)."""
+        hr, rr, spo2, temp, sbp, dbp = self.state.tolist()
         return {
-            "HR": round(self.hr),
-            "RR": round(self.rr),
-            "SpO2": round(self.spo2, 1),
-            "Temp": round(self.temp, 1),
-            "Sys": round(self.sys),
-            "Dia": round(self.dia),
-            "MAP": round(self.map),
+            "HR": f"{hr:.0f}",
+            "RR": f"{rr:.0f}",
+            "SpO2": f"{spo2:.1f}",
+            "Temp": f"{temp:.1f}",
+            "Sys": f"{sbp:.0f}",
+            "Dia": f"{dbp:.0f}",
+            "MAP": f"{self.map:.0f}",
         }
 
+# One placer-number counter for every builder in the process, so OBR-2 never repeats.
+_PROC_ID = os.getpid()
+_placer_seq = itertools.count(1)
+
 class HL7Builder:
     """Builds an ORU^R01 message with vitals as OBX segments (HL7 v2.5)."""
 
@@ -103,59 +120,43 @@ class HL7Builder:
         self.version = version
         self.ctrl_id = 1
 
+        # Everything in MSH/PID/OBR except time, control ID, patient and device is
+        # constant per builder, so format it once and fill the rest per message.
+        head = FIELD_SEP.join((sending_app, sending_fac, receiving_app, receiving_fac))
+        head = head.replace("{", "{{").replace("}", "}}")
+        ver = version.replace("{", "{{").replace("}", "}}")
+        self._prefix_tpl = (
+            # MSH: encoding chars, sender/receiver, time, security, type, control ID, processing ID, version
+            "MSH|^~\\&|" + head + "|{ts}||ORU^R01^ORU_R01|{cid}|P|" + ver + "\r"
+            # PID: set ID, patient identifier (CX), name (XPN), sex
+            "PID|1||{pid}^^^HOSP^MR||{name}||||||||||M\r"
+            # OBR: set ID, placer/filler order number, universal service ID, observation time, status F=Final
+            "OBR|1|{placer}^ICU_SIM|{dev}^DEVICE|VITALS^Vital Signs Panel^L^76499-3^Vital signs^LN||||||||||{ts}||||||F\r"
+        )
+
     def next_ctrl_id(self):
         cid = f"MSG{int(time.time())}-{self.ctrl_id}"
         self.ctrl_id += 1
         return cid
 
+    def next_placer_id(self):
+        """Placer order number unique within this process (cheaper than uuid4)."""
+        return f"{_PROC_ID}{next(_placer_seq):08d}"
+
     def build(self, patient_id="123456", patient_name="DOE^JOHN", device_id="MONITOR^ICU-01", vitals: dict | None = None,
-              observation_dt: datetime | None = None) -> str:
+              observation_dt: datetime | None = None) -> bytes:
         if vitals is None:
             raise ValueError("vitals dict required")
-        if observation_dt is None:
-            observation_dt = datetime.now(timezone.utc)
-
         message_time = ts(observation_dt)
 
-        # MSH
-        msh = seg("MSH",
-                  "^~\\&",
-                  self.sending_app,
-                  self.sending_fac,
-                  self.receiving_app,
-                  self.receiving_fac,
-                  message_time,
-                  "",                   # Security
-                  "ORU^R01^ORU_R01",    # Message Type
-                  self.next_ctrl_id(),  # Message Control ID
-                  "P",                  # Processing ID
-                  self.version          # Version
-                  )
-
-        # PID
-        pid = seg("PID",
-                  "1",                 # Set ID
-                  "",                  # Patient ID (External)
-                  comp(patient_id, "", "", "HOSP^MR"),  # Patient Identifier List (Cx)
-                  "",                  # Alternate ID
-                  patient_name,        # Patient Name (XPN)
-                  "", "", "", "", "",  # Mother's Maiden, etc.
-                  "",                  # Phone
-                  "", "", "",          # Address, County, Phone
-                  "M"                  # Sex (optional)
-                  )
-
-        # OBR
-        obr = seg("OBR",
-                  "1",                  # Set ID
-                  comp(str(uuid.uuid4()), "ICU_SIM"),   # Placer Order Number
-                  comp(device_id, "DEVICE"),            # Filler Order Number
-                  comp("VITALS", "Vital Signs Panel", "L", "76499-3", "Vital signs", "LN"), # Universal Service ID
-                  "", "", "", "", "", "", "", "", "",   # Timing/Quantity etc.
-                  message_time,        # Observation Date/Time
-                  "", "", "", "", "",
-                  "F"                  # Result status: F=Final
-                  )
+        prefix = self._prefix_tpl.format_map({
+            "ts": message_time,               # MSH-7 / OBR-14 Observation Date/Time
+            "cid": self.next_ctrl_id(),       # MSH-10 Message Control ID
+            "pid": patient_id,                # PID-3 Patient Identifier List (CX)
+            "name": patient_name,             # PID-5 Patient Name (XPN)
+            "placer": self.next_placer_id(),  # OBR-2 Placer Order Number
+            "dev": device_id,                 # OBR-3 Filler Order Number
+        })
 
         # OBX segments for each vital
         obx_segments = []
@@ -175,42 +176,40 @@ class HL7Builder:
         for (id_code, id_text, id_sys), (unit_code, _unit_text), value in metrics:
             if value is None:
                 continue
-            obs_id = comp(id_code, id_text, id_sys)
-            units = comp(unit_code, "", "UCUM")
-            obx = seg("OBX",
-                      str(set_id),       # OBX-1 Set ID
-                      "NM",              # OBX-2 Value Type (Numeric)
-                      obs_id,            # OBX-3 Identifier (CE)
-                      "",                # OBX-4 Sub-ID
-                      str(value),        # OBX-5 Observation Value
-                      units,             # OBX-6 Units
-                      "",                # OBX-7 Reference Range
-                      "",                # OBX-8 Abnormal Flags
-                      "",                # OBX-9 Probability
-                      "",                # OBX-10 Nature of Abnormal Test
-                      "F",               # OBX-11 Observation Result Status
-                      "",                # OBX-12 Effective Date of Reference Range
-                      message_time,      # OBX-14 Date/Time of the Observation
-                      "", "", "", "", "", "", "", "", "", "", "", ""
-                      )
-            obx_segments.append(obx)
+            obx_segments.append(_OBX_NM_TPL.format(i=set_id, c=id_code, t=id_text, s=id_sys, v=value, u=unit_code,
+                                                   ot=message_time))
             set_id += 1
 
-        return msh + pid + obr + "".join(obx_segments)
+        # Join once, encode once: MLLPClient.send() takes the bytes as-is.
+        return "".join([prefix, *obx_segments]).encode("utf-8")
 
 class MLLPClient:
-    """Minimal MLLP sender. Opens a TCP connection per message unless keepalive=True."""
-    def __init__(self, host: str, port: int, timeout: float = 10.0, keepalive: bool = True):
+    """Minimal MLLP sender. Opens a TCP connection per message unless keepalive=True.
+
+    Connections run with Nagle disabled and enlarged socket buffers; SO_KEEPALIVE is
+    only enabled for keepalive=True, since per-message connections never sit idle.
+
+    skip_ack=True returns right after the write instead of blocking on the ACK; use it
+    for throughput runs against receivers that don't ACK (unread ACKs would pile up).
+    """
+    def __init__(self, host: str, port: int, timeout: float = 10.0, keepalive: bool = True,
+                 skip_ack: bool = False):
         self.host = host
         self.port = port
         self.timeout = timeout
         self.keepalive = keepalive
+        self.skip_ack = skip_ack
         self.sock: socket.socket | None = None
 
     def connect(self):
         if self.sock is None:
             s = socket.create_connection((self.host, self.port), timeout=self.timeout)
             s.settimeout(self.timeout)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # don't hold small messages back (Nagle)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
+            if self.keepalive:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             self.sock = s
 
     def close(self):
@@ -220,16 +219,23 @@ class MLLPClient:
             finally:
                 self.sock = None
 
-    def send(self, hl7_message: str) -> str | None:
-        data = SB + hl7_message.encode("utf-8") + EB + CR
+    def send(self, hl7_message: bytes) -> str | None:
         try:
             self.connect()
-            assert self.sock is not None
-            self.sock.sendall(data)
+            sock = self.sock
+            # Gather-write the frame pieces; no userland concatenation unless the write is partial.
+            if hasattr(sock, "sendmsg"):
+                sent = sock.sendmsg([SB, hl7_message, EB_CR])
+                if sent < len(hl7_message) + 3:
+                    sock.sendall(b"".join((SB, hl7_message, EB_CR))[sent:])
+            else:  # Windows has no sendmsg()
+                sock.sendall(b"".join((SB, hl7_message, EB_CR)))
+            if self.skip_ack:
+                return None
 
             # Attempt to receive ACK (optional)
             try:
-                ack = self.sock.recv(4096)
+                ack = sock.recv(4096)
                 if ack:
                     return ack.decode("utf-8", errors="ignore")
             except socket.timeout:
@@ -250,23 +256,24 @@ def main():
     parser.add_argument("--patient-name", type=str, default="DOE^JOHN", help="HL7 XPN format: LAST^FIRST")
     parser.add_argument("--device-id", type=str, default="MONITOR^ICU-01")
     parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducibility")
+    parser.add_argument("--skip-ack", action="store_true", help="Don't wait for ACKs (for receivers that never send them)")
     args = parser.parse_args()
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         parser.error("Choose an output: --stdout or --mllp-host/--mllp-port")
 
-    rnd = random.Random(args.seed)
     vitals = VitalModel(seed=args.seed)
     builder = HL7Builder()
 
     mllp_client = None
     if args.mllp_host and args.mllp_port:
-        mllp_client = MLLPClient(args.mllp_host, args.mllp_port)
+        mllp_client = MLLPClient(args.mllp_host, args.mllp_port, skip_ack=args.skip_ack)
 
+    out = sys.stdout.buffer
     sent = 0
     try:
         while True:
-            vitals.step(rnd)
+            vitals.step()
             snapshot = vitals.snapshot()
             msg = builder.build(patient_id=args.patient_id,
                                 patient_name=args.patient_name,
@@ -274,14 +281,16 @@ def main():
                                 vitals=snapshot)
 
             if args.stdout:
-                sys.stdout.write(msg + "\n")
-                sys.stdout.flush()
+                out.write(msg)
+                out.write(b"\n")
 
             if mllp_client:
                 ack = mllp_client.send(msg)
                 if ack and args.stdout:
-                    sys.stdout.write(f"MLLP ACK received:\n{ack}\n")
-                    sys.stdout.flush()
+                    out.write(f"MLLP ACK received:\n{ack}\n".encode("utf-8"))
+
+            if args.stdout:
+                out.flush()  # once per tick, covering the message and its ACK
 
             sent += 1
             if args.count and sent >= args.count:
@@ -290,6 +299,8 @@ def main():
     except KeyboardInterrupt:
         pass
     finally:
+        if args.stdout:
+            out.flush()
         if mllp_client:
             mllp_client.close()
 
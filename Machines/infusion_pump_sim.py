@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
-import argparse, random, sys, time
-from hl7_common import HL7Builder, MLLPClient, ts, seg, comp
+import argparse, asyncio, random
+from hl7_common import HL7Builder, MessageBatch, add_mllp_args, stdout, run_simulator, ts, obx_nm, seg, comp
 
 DRUGS = [
     ("NORAD", "Norepinephrine"),
@@ -22,9 +22,9 @@ class PumpModel:
         self.rate = max(0.0, min(50.0, self.rate + r.uniform(-1.5, 1.5)))
         self.vol  = max(0.0, self.vol + self.rate/60.0)
 
-def main():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Infusion Pump Simulator")
-    p.add_argument("--mllp-host"); p.add_argument("--mllp-port", type=int)
+    add_mllp_args(p)
     p.add_argument("--stdout", action="store_true")
     p.add_argument("--interval", type=float, default=60.0)
     p.add_argument("--count", type=int, default=0)
@@ -32,33 +32,41 @@ def main():
     p.add_argument("--patient-name", default="DOE^JOHN")
     p.add_argument("--device-id", default="PUMP^ICU-01")
     p.add_argument("--seed", type=int, default=None)
-    args = p.parse_args()
+    args = p.parse_args(argv)
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         p.error("Choose an output: --stdout or --mllp-host/--mllp-port")
+    return args
 
+async def run(client, args):
     b = HL7Builder(sending_app="PUMP_SIM")
-    client = MLLPClient(args.mllp_host, args.mllp_port) if args.mllp_host and args.mllp_port else None
     model = PumpModel(args.seed)
 
     sent=0
+    batch = MessageBatch(client, args.batch, args.max_hold) if client else None
     try:
         while True:
             model.step()
             now = ts()
             obxs = []
-            obxs.append(b.obx_numeric(1, "PUMP_RATE", "Infusion rate", "L", round(model.rate,1), "mL/h", observation_time=now))
-            obxs.append(b.obx_numeric(2, "PUMP_VOL", "Volume infused", "L", round(model.vol,1), "mL", observation_time=now))
+            obxs.append(obx_nm(1, "PUMP_RATE", "Infusion rate", "L", f"{model.rate:.1f}", "mL/h", now))
+            obxs.append(obx_nm(2, "PUMP_VOL", "Volume infused", "L", f"{model.vol:.1f}", "mL", now))
             obxs.append(seg("OBX","3","TX",comp("PUMP_DRUG","Drug name","L"),"",model.drug_name,"","","","","","F","",now))
 
             msg = b.build_message(args.patient_id, args.patient_name, args.device_id, obxs, now)
-            if args.stdout: sys.stdout.write(msg + "\n"); sys.stdout.flush()
-            if client: client.send(msg)
+            if args.stdout: stdout.write(msg)
+            if client: batch.append(msg)
+            wait = max(0.5, args.interval)
+            if client: await batch.send_due(wait)
+            if args.stdout: stdout.maybe_flush(wait)
             sent+=1
             if args.count and sent>=args.count: break
-            time.sleep(max(0.5, args.interval))
-    except KeyboardInterrupt:
-        pass
+            await asyncio.sleep(wait)
+    finally:
+        if client: await batch.close()
+
+def main():
+    run_simulator(run, parse_args())
 
 if __name__ == "__main__":
     main()
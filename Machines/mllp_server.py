@@ -1,39 +1,121 @@
-import socket
+import selectors, socket
 
 HOST = "127.0.0.1"
 PORT = 2575
+RECV_SIZE = 65536
 
 START_BLOCK = b"\x0b"
 END_BLOCK = b"\x1c"
 CARRIAGE_RETURN = b"\x0d"
 
+ACK_TEMPLATE = (
+    "MSH|^~\\&|MLLP_SERVER|TEST_FAC|||20250817153000||ACK^A01|{0}|P|2.5\r"
+    "MSA|AA|{0}\r"
+)
+
 def build_ack(msg_control_id="1"):
-    return (
-        START_BLOCK +
-        f"MSH|^~\\&|MLLP_SERVER|TEST_FAC|||20250817153000||ACK^A01|{msg_control_id}|P|2.5\r"
-        f"MSA|AA|{msg_control_id}\r".encode() +
-        END_BLOCK + CARRIAGE_RETURN
-    )
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    return START_BLOCK + ACK_TEMPLATE.format(msg_control_id).encode() + END_BLOCK + CARRIAGE_RETURN
+
+ACK = build_ack("1")
+
+# One receive buffer shared by every connection; only partial frames are copied out of it.
+recv_buf = bytearray(RECV_SIZE)
+recv_view = memoryview(recv_buf)
+
+def drain(buf, view, end):
+    """Print every complete frame in buf[:end]; return (bytes consumed, frames seen)."""
+    consumed = frames = 0
+    while True:
+        start = buf.find(START_BLOCK, consumed, end)
+        if start < 0:
+            break
+        stop = buf.find(END_BLOCK, start + 1, end)
+        if stop < 0:
+            break
+        hl7_msg = str(view[start + 1 : stop], "utf-8")
+        consumed = min(stop + 2, end)  # skip END_BLOCK + CR
+        frames += 1
+        print("\n--- HL7 message received ---")
+        print(hl7_msg)
+        print("---------------------------\n")
+    return consumed, frames
+
+# ACK bytes a peer may leave unread before we stop reading its messages.
+OUTBOX_LIMIT = 1 << 20
+
+class Peer:
+    __slots__ = ("pending", "outbox")
+
+    def __init__(self):
+        self.pending = bytearray()  # partial frame carried over to the next read
+        self.outbox = bytearray()   # ACKs the peer's socket hasn't taken yet
+
+def accept(sel, s):
+    conn, addr = s.accept()
+    print(f"Connected by {addr}")
+    # Non-blocking, so a peer that stops reading its ACKs can't stall the others.
+    conn.setblocking(False)
+    sel.register(conn, selectors.EVENT_READ, Peer())
+
+def close(sel, conn, peer):
+    sel.unregister(conn)
+    conn.close()
+    peer.outbox.clear()
+
+def read(sel, conn, peer):
+    try:
+        n = conn.recv_into(recv_view)
+    except BlockingIOError:
+        return
+    except ConnectionResetError:  # e.g. a skip_ack sender closing with our ACKs unread
+        n = 0
+    if not n:
+        close(sel, conn, peer)
+        return
+    pending = peer.pending
+    if pending:
+        pending += recv_view[:n]
+        with memoryview(pending) as view:
+            consumed, frames = drain(pending, view, len(pending))
+        del pending[:consumed]
+    else:
+        # Common case: whole frames arrived in this read, so parse them in place.
+        consumed, frames = drain(recv_buf, recv_view, n)
+        pending += recv_view[consumed:n]
+    if frames:
+        peer.outbox += ACK * frames
+        write(sel, conn, peer)
+
+def write(sel, conn, peer):
+    """Send what the socket takes now; wait for EVENT_WRITE while ACKs are left over."""
+    try:
+        del peer.outbox[:conn.send(peer.outbox)]
+    except BlockingIOError:
+        pass
+    except (BrokenPipeError, ConnectionResetError):
+        close(sel, conn, peer)
+        return
+    if not peer.outbox:
+        events = selectors.EVENT_READ
+    elif len(peer.outbox) < OUTBOX_LIMIT:
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE
+    else:
+        events = selectors.EVENT_WRITE
+    if sel.get_key(conn).events != events:
+        sel.modify(conn, events, peer)
+
+with selectors.DefaultSelector() as sel, socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((HOST, PORT))
-    s.listen(1)
+    s.listen()
+    sel.register(s, selectors.EVENT_READ, None)
     print(f"MLLP server listening on {HOST}:{PORT}")
-    conn, addr = s.accept()
-    with conn:
-        print(f"Connected by {addr}")
-        buffer = b""
-        while True:
-            data = conn.recv(1024)
-            if not data:
-                break
-            buffer += data
-            while START_BLOCK in buffer and END_BLOCK in buffer:
-                start = buffer.index(START_BLOCK) + 1
-                end = buffer.index(END_BLOCK)
-                hl7_msg = buffer[start:end].decode()
-                buffer = buffer[end + 2 :]  # skip END_BLOCK + CR
-                print("\n--- HL7 message received ---")
-                print(hl7_msg)
-                print("---------------------------\n")
-                conn.sendall(build_ack("1"))
+    while True:
+        for key, mask in sel.select():
+            if key.data is None:
+                accept(sel, key.fileobj)
+                continue
+            if mask & selectors.EVENT_READ:
+                read(sel, key.fileobj, key.data)
+            if mask & selectors.EVENT_WRITE and key.data.outbox:
+                write(sel, key.fileobj, key.data)
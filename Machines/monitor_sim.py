@@ -1,79 +1,96 @@
 #!/usr/bin/env python3
-import argparse, random, sys, time
-from hl7_common import HL7Builder, MLLPClient, ts
+import argparse, asyncio
+import numpy as np
+import random_walk
+from hl7_common import HL7Builder, MessageBatch, add_mllp_args, stdout, bed_ids, run_simulator, ts
+
+METRICS = [
+    ("8867-4","Heart rate","LN","/min","HR"),
+    ("59408-5","Oxygen saturation in Arterial blood by Pulse oximetry","LN","%","SpO2"),
+    ("8310-5","Body temperature","LN","Cel","Temp"),
+    ("8480-6","Systolic blood pressure","LN","mm[Hg]","Sys"),
+    ("8462-4","Diastolic blood pressure","LN","mm[Hg]","Dia"),
+    ("8478-0","Mean blood pressure","LN","mm[Hg]","MAP"),
+]
+# Everything but the value and time is fixed per metric, so bake it into one template each.
+_OBX_TEMPLATES = [f"OBX|{i}|NM|{code}^{text}^{cs}||{{v}}|{unit}^^UCUM|||||F||{{ot}}\r"
+                  for i,(code,text,cs,unit,key) in enumerate(METRICS, start=1)]
+_KEYS = [m[4] for m in METRICS]
 
 class MonitorModel:
-    def __init__(self, seed=None):
-        self.rnd = random.Random(seed)
-        self.hr  = self.rnd.uniform(70, 95)
-        self.spo2= self.rnd.uniform(95, 99)
-        self.temp= self.rnd.uniform(36.5, 37.3)
-        self.sys = self.rnd.uniform(110, 130)
-        self.dia = self.rnd.uniform(70, 85)
+    # state rows: HR, SpO2, Temp, Sys, Dia; one column per bed
+    _LO   = np.array([45, 80, 35.0, 80, 40])
+    _HI   = np.array([150, 100, 40.0, 200, 120])
+    _STEP = np.array([2.0, 0.4, 0.08, 2.5, 2.0])
+
+    def __init__(self, seed=None, num_beds=1):
+        self._rng = np.random.default_rng(seed)
+        self.state = self._rng.uniform([[70], [95], [36.5], [110], [70]], [[95], [99], [37.3], [130], [85]],
+                                       (5, num_beds))
 
     def step(self):
-        r = self.rnd
-        def rw(v, lo, hi, step):
-            return max(lo, min(hi, v + r.uniform(-step, step)))
-        self.hr   = rw(self.hr,   45, 150, 2.0)
-        self.spo2 = rw(self.spo2, 80, 100, 0.4)
-        self.temp = rw(self.temp, 35.0, 40.0, 0.08)
-        self.sys  = rw(self.sys,  80, 200, 2.5)
-        self.dia  = rw(self.dia,  40, 120, 2.0)
+        random_walk.step(self.state, self._LO, self._HI, self._STEP, self._rng)
 
     @property
     def map(self):
-        return self.dia + (self.sys - self.dia)/3.0
+        sbp, dbp = self.state[3:5]
+        return dbp + (sbp - dbp)/3.0
 
     def snapshot(self):
-        return {"HR": round(self.hr), "SpO2": round(self.spo2,1), "Temp": round(self.temp,1),
-                "Sys": round(self.sys), "Dia": round(self.dia), "MAP": round(self.map)}
+        """Per-bed OBX-5 strings for each metric key, formatted once here."""
+        hr, spo2, temp, sbp, dbp = self.state.tolist()
+        whole = lambda col: [f"{v:.0f}" for v in col]
+        return {"HR": whole(hr), "SpO2": [f"{v:.1f}" for v in spo2], "Temp": [f"{v:.1f}" for v in temp],
+                "Sys": whole(sbp), "Dia": whole(dbp), "MAP": whole(self.map.tolist())}
 
-def main():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Bedside Monitor Simulator")
-    p.add_argument("--mllp-host"); p.add_argument("--mllp-port", type=int)
+    add_mllp_args(p)
     p.add_argument("--stdout", action="store_true")
     p.add_argument("--interval", type=float, default=1.0)
-    p.add_argument("--count", type=int, default=0)
+    p.add_argument("--count", type=int, default=0, help="Ticks to run, each sending one message per bed (0 = forever)")
     p.add_argument("--patient-id", default="123456")
     p.add_argument("--patient-name", default="DOE^JOHN")
     p.add_argument("--device-id", default="MONITOR^ICU-01")
     p.add_argument("--seed", type=int, default=None)
-    args = p.parse_args()
+    p.add_argument("--num-beds", type=int, default=1)
+    args = p.parse_args(argv)
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         p.error("Choose an output: --stdout or --mllp-host/--mllp-port")
+    if args.num_beds < 1:
+        p.error("--num-beds must be at least 1")
+    return args
 
-    model = MonitorModel(args.seed)
+async def run(client, args):
+    model = MonitorModel(args.seed, args.num_beds)
     b = HL7Builder(sending_app="MONITOR_SIM")
-    client = MLLPClient(args.mllp_host, args.mllp_port) if args.mllp_host and args.mllp_port else None
-
-    metrics = [
-        ("8867-4","Heart rate","LN","/min","HR"),
-        ("59408-5","Oxygen saturation in Arterial blood by Pulse oximetry","LN","%","SpO2"),
-        ("8310-5","Body temperature","LN","Cel","Temp"),
-        ("8480-6","Systolic blood pressure","LN","mm[Hg]","Sys"),
-        ("8462-4","Diastolic blood pressure","LN","mm[Hg]","Dia"),
-        ("8478-0","Mean blood pressure","LN","mm[Hg]","MAP"),
-    ]
+    beds = bed_ids(args.patient_id, args.device_id, args.num_beds)
 
     sent=0
+    batch = MessageBatch(client, args.batch, args.max_hold) if client else None
     try:
         while True:
             model.step()
             snap = model.snapshot()
+            columns = [snap[k] for k in _KEYS]
             now = ts()
-            obxs = []
-            for i,(code,text,cs,unit,key) in enumerate(metrics, start=1):
-                obxs.append(b.obx_numeric(i, code, text, cs, snap[key], unit, observation_time=now))
-            msg = b.build_message(args.patient_id, args.patient_name, args.device_id, obxs, now)
-            if args.stdout: sys.stdout.write(msg + "\n"); sys.stdout.flush()
-            if client: client.send(msg)
+            for bed,(patient_id,device_id) in enumerate(beds):
+                obxs = [tpl.format(v=col[bed], ot=now) for tpl,col in zip(_OBX_TEMPLATES, columns)]
+                msg = b.build_message(patient_id, args.patient_name, device_id, obxs, now)
+                if args.stdout: stdout.write(msg)
+                if client: batch.append(msg)
+            wait = max(0.05, args.interval)
+            if client: await batch.send_due(wait)
+            if args.stdout: stdout.maybe_flush(wait)
             sent+=1
             if args.count and sent>=args.count: break
-            time.sleep(max(0.05, args.interval))
-    except KeyboardInterrupt:
-        pass
+            await asyncio.sleep(wait)
+    finally:
+        if client: await batch.close()
+
+def main():
+    run_simulator(run, parse_args())
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
-import argparse, subprocess, sys, time, os
+import argparse, asyncio
+import capnograph_sim, infusion_pump_sim, monitor_sim, ventilator_sim
+from hl7_common import AsyncMLLPClient, stdout
 
-SCRIPTS = [
-    ("monitor_sim.py",     ["--interval","1.0","--device-id","MONITOR^BED-01"]),
-    ("ventilator_sim.py",  ["--interval","2.0","--device-id","VENT^BED-01"]),
-    ("capnograph_sim.py",  ["--interval","3.0","--device-id","CAPNO^BED-01"]),
-    ("infusion_pump_sim.py",["--interval","60.0","--device-id","PUMP^BED-01"]),
+SIMULATORS = [
+    (monitor_sim,       ["--interval","1.0","--device-id","MONITOR^BED-01"]),
+    (ventilator_sim,    ["--interval","2.0","--device-id","VENT^BED-01"]),
+    (capnograph_sim,    ["--interval","3.0","--device-id","CAPNO^BED-01"]),
+    (infusion_pump_sim, ["--interval","60.0","--device-id","PUMP^BED-01"]),
 ]
 
+async def run_all(args):
+    # All simulators run as coroutines on one event loop and share one persistent MLLP connection.
+    client = None
+    if args.mllp_host and args.mllp_port:
+        client = AsyncMLLPClient(args.mllp_host, args.mllp_port, keepalive=True, skip_ack=args.skip_ack)
+    runs = []
+    try:
+        for sim, extra in SIMULATORS:
+            argv = []
+            if args.stdout:
+                argv.append("--stdout")
+            if args.mllp_host and args.mllp_port:
+                argv += ["--mllp-host", args.mllp_host, "--mllp-port", str(args.mllp_port)]
+            argv += ["--patient-id", args.patient_id, "--patient-name", args.name]
+            argv += extra
+            print("Starting:", sim.__name__, " ".join(argv), flush=True)
+            runs.append(sim.run(client, sim.parse_args(argv)))
+        print("All simulators running. Ctrl+C to stop.")
+        await asyncio.gather(*runs)
+    finally:
+        if client:
+            await client.close()
+
 def main():
     ap = argparse.ArgumentParser(description="ICU Simulators Orchestrator")
     ap.add_argument("--mllp-host", required=False)
@@ -15,34 +40,17 @@ def main():
     ap.add_argument("--patient-id", default="123456")
     ap.add_argument("--name", default="DOE^JOHN")
     ap.add_argument("--stdout", action="store_true")
+    ap.add_argument("--skip-ack", action="store_true", help="Don't wait for ACKs (for receivers that never send them)")
     args = ap.parse_args()
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         ap.error("Choose an output: --stdout or --mllp-host/--mllp-port")
 
-    procs = []
     try:
-        for script, extra in SCRIPTS:
-            cmd = [sys.executable, script]
-            if args.stdout:
-                cmd.append("--stdout")
-            if args.mllp_host and args.mllp_port:
-                cmd += ["--mllp-host", args.mllp_host, "--mllp-port", str(args.mllp_port)]
-            cmd += ["--patient-id", args.patient_id, "--patient-name", args.name]
-            cmd += extra
-            print("Starting:", " ".join(cmd), flush=True)
-            procs.append(subprocess.Popen(cmd, cwd=os.path.dirname(__file__)))
-        print("All simulators running. Ctrl+C to stop.")
-        while True:
-            time.sleep(1)
+        asyncio.run(run_all(args))
     except KeyboardInterrupt:
+        stdout.flush()
         print("Stopping...")
-        for p in procs:
-            try: p.terminate()
-            except Exception: pass
-        for p in procs:
-            try: p.wait(timeout=5)
-            except Exception: pass
 
 if __name__ == "__main__":
     main()
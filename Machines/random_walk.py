@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Bounded random-walk update shared by the vital-sign models.
+
+Numba is optional: with it, very large states (many beds) are stepped by a JIT
+kernel. Once compiled the kernel is faster at every size, but smaller states stay
+on plain NumPy because at simulator tick rates its one-off compile never pays off.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Values per step from which the JIT kernel repays its first call. Measured with
+# numba 0.68: the first call costs ~140 ms from the on-disk cache (~430 ms to
+# compile), while a step saves ~10 us at 6k values and ~110 us at 240k. Below this
+# size breaking even takes over an hour of 1 Hz ticks.
+JIT_MIN_SIZE = 200_000
+
+def _step_np(state, lo, hi, noise):
+    np.add(state, noise, out=state)
+    np.clip(state, lo, hi, out=state)
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _step_jit(state, lo, hi, noise):
+        rows = lo.size
+        cols = state.size // rows
+        s = state.reshape((rows, cols))
+        z = noise.reshape((rows, cols))
+        for i in range(rows):
+            for j in range(cols):
+                v = s[i, j] + z[i, j]
+                s[i, j] = lo[i] if v < lo[i] else (hi[i] if v > hi[i] else v)
+else:
+    _step_jit = None
+
+def step(state, lo, hi, spread, rng):
+    """Advance state in place by U(-spread, spread), clipped to [lo, hi].
+
+    lo, hi and spread hold one value per row of state; any further axes (one
+    column per bed) share them, so all beds are stepped in one call.
+    """
+    rows = (slice(None),) + (None,) * (state.ndim - 1)
+    noise = rng.uniform(-spread[rows], spread[rows], state.shape)
+    if _step_jit is not None and state.size >= JIT_MIN_SIZE:
+        _step_jit(state, lo, hi, noise)
+    else:
+        _step_np(state, lo[rows], hi[rows], noise)
@@ -0,0 +1,4 @@
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(name="hl7-speedups", ext_modules=cythonize("_hl7_speedups.pyx"))
@@ -1,62 +1,74 @@
 #!/usr/bin/env python3
-import argparse, random, sys, time
-from hl7_common import HL7Builder, MLLPClient, ts
+import argparse, asyncio
+import numpy as np
+import random_walk
+from hl7_common import HL7Builder, MessageBatch, add_mllp_args, stdout, bed_ids, run_simulator, ts, obx_nm
 
 class VentModel:
-    def __init__(self, seed=None):
-        self.rnd = random.Random(seed)
-        self.rr   = self.rnd.uniform(12, 20)
-        self.vte  = self.rnd.uniform(380, 520)
-        self.peep = self.rnd.uniform(4, 8)
-        self.fio2 = self.rnd.uniform(0.30, 0.5)
+    # state rows: RR, VTe, PEEP, FiO2; one column per bed
+    _LO   = np.array([8, 200, 0, 0.21])
+    _HI   = np.array([35, 800, 20, 1.0])
+    _STEP = np.array([0.8, 15.0, 0.5, 0.02])
+
+    def __init__(self, seed=None, num_beds=1):
+        self._rng = np.random.default_rng(seed)
+        self.state = self._rng.uniform([[12], [380], [4], [0.30]], [[20], [520], [8], [0.5]], (4, num_beds))
 
     def step(self):
-        r = self.rnd
-        def rw(v, lo, hi, step):
-            return max(lo, min(hi, v + r.uniform(-step, step)))
-        self.rr   = rw(self.rr,   8, 35, 0.8)
-        self.vte  = rw(self.vte,  200, 800, 15.0)
-        self.peep = rw(self.peep, 0, 20, 0.5)
-        self.fio2 = rw(self.fio2, 0.21, 1.0, 0.02)
+        random_walk.step(self.state, self._LO, self._HI, self._STEP, self._rng)
 
-def main():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Ventilator Simulator")
-    p.add_argument("--mllp-host"); p.add_argument("--mllp-port", type=int)
+    add_mllp_args(p)
     p.add_argument("--stdout", action="store_true")
     p.add_argument("--interval", type=float, default=2.0)
-    p.add_argument("--count", type=int, default=0)
+    p.add_argument("--count", type=int, default=0, help="Ticks to run, each sending one message per bed (0 = forever)")
     p.add_argument("--patient-id", default="123456")
     p.add_argument("--patient-name", default="DOE^JOHN")
     p.add_argument("--device-id", default="VENT^ICU-01")
     p.add_argument("--seed", type=int, default=None)
-    args = p.parse_args()
+    p.add_argument("--num-beds", type=int, default=1)
+    args = p.parse_args(argv)
 
     if not args.stdout and not (args.mllp_host and args.mllp_port):
         p.error("Choose an output: --stdout or --mllp-host/--mllp-port")
+    if args.num_beds < 1:
+        p.error("--num-beds must be at least 1")
+    return args
 
+async def run(client, args):
     b = HL7Builder(sending_app="VENTILATOR_SIM")
-    client = MLLPClient(args.mllp_host, args.mllp_port) if args.mllp_host and args.mllp_port else None
-    model = VentModel(args.seed)
+    model = VentModel(args.seed, args.num_beds)
+    beds = bed_ids(args.patient_id, args.device_id, args.num_beds)
 
     sent=0
+    batch = MessageBatch(client, args.batch, args.max_hold) if client else None
     try:
         while True:
             model.step()
+            rr, vte, peep, fio2 = model.state.tolist()
             now = ts()
-            obxs = []
-            obxs.append(b.obx_numeric(1, "9279-1", "Respiratory rate", "LN", round(model.rr), "/min", observation_time=now))
-            obxs.append(b.obx_numeric(2, "19868-9", "Tidal volume setting Ventilator", "LN", round(model.vte), "mL", observation_time=now))
-            obxs.append(b.obx_numeric(3, "20077-4", "Positive end expiratory pressure setting Ventilator", "LN", round(model.peep,1), "cm[H2O]", observation_time=now))
-            obxs.append(b.obx_numeric(4, "3150-0", "Oxygen inhaled concentration", "LN", round(model.fio2*100,1), "%", observation_time=now))
-
-            msg = b.build_message(args.patient_id, args.patient_name, args.device_id, obxs, now)
-            if args.stdout: sys.stdout.write(msg + "\n"); sys.stdout.flush()
-            if client: client.send(msg)
+            for bed,(patient_id,device_id) in enumerate(beds):
+                obxs = []
+                obxs.append(obx_nm(1, "9279-1", "Respiratory rate", "LN", f"{rr[bed]:.0f}", "/min", now))
+                obxs.append(obx_nm(2, "19868-9", "Tidal volume setting Ventilator", "LN", f"{vte[bed]:.0f}", "mL", now))
+                obxs.append(obx_nm(3, "20077-4", "Positive end expiratory pressure setting Ventilator", "LN", f"{peep[bed]:.1f}", "cm[H2O]", now))
+                obxs.append(obx_nm(4, "3150-0", "Oxygen inhaled concentration", "LN", f"{fio2[bed]*100:.1f}", "%", now))
+
+                msg = b.build_message(patient_id, args.patient_name, device_id, obxs, now)
+                if args.stdout: stdout.write(msg)
+                if client: batch.append(msg)
+            wait = max(0.05, args.interval)
+            if client: await batch.send_due(wait)
+            if args.stdout: stdout.maybe_flush(wait)
             sent+=1
             if args.count and sent>=args.count: break
-            time.sleep(max(0.05, args.interval))
-    except KeyboardInterrupt:
-        pass
+            await asyncio.sleep(wait)
+    finally:
+        if client: await batch.close()
+
+def main():
+    run_simulator(run, parse_args())
 
 if __name__ == "__main__":
     main()